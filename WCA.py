@@ -1,8 +1,13 @@
 import requests
 import zipfile
+import io
 import os
 import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pacsv
 from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
@@ -14,29 +19,83 @@ from selenium.webdriver.support import expected_conditions as EC
 WCA_RANKINGS_URL = "https://www.worldcubeassociation.org/export/results/WCA_export.tsv"
                     
 WCA_FILE = "WCA_export_RanksSingle.tsv"
-ZIP_FILE = "WCA_export.zip"
+WCA_PARQUET = "WCA_export_RanksSingle.parquet"
+WCA_ETAG_FILE = WCA_FILE + ".etag"
+WCA_COLUMNS = ["personId","eventId","best","worldRank"]
+WCA_DTYPES = {"personId": "string[pyarrow]", "eventId": "category", "best": "int32", "worldRank": "int32"}
+CHUNK_SIZE = 1 << 20  # 1 MiB
 
 def download_wca_data():
-    if os.path.exists(WCA_FILE):
-        print(f"Using existing file: {WCA_FILE}")
-        return
-    print("Downloading WCA rankings data...")
-    r = requests.get(WCA_RANKINGS_URL)
-    with open(ZIP_FILE, "wb") as f:
-        f.write(r.content)
-    with zipfile.ZipFile(ZIP_FILE, 'r') as z:
-        z.extract(WCA_FILE)
-    os.remove(ZIP_FILE)
-    print("WCA rankings data downloaded and extracted.")
+    # One session, used only on this thread, so the download reuses the HEAD check's connection
+    with requests.Session() as session:
+        # Ask for the export's ETag and skip the download if our copy is still current
+        try:
+            h = session.head(WCA_RANKINGS_URL, allow_redirects=True, timeout=30)
+            etag = h.headers.get("ETag") if h.ok else None
+        except requests.RequestException:
+            etag = None
+        if os.path.exists(WCA_FILE):
+            saved = None
+            if os.path.exists(WCA_ETAG_FILE):
+                with open(WCA_ETAG_FILE) as f:
+                    saved = f.read().strip()
+            if etag is None or etag == saved:
+                print(f"Using existing file: {WCA_FILE}")
+                return
+        print("Downloading WCA rankings data...")
+        buf = io.BytesIO()
+        with session.get(WCA_RANKINGS_URL, stream=True, timeout=30) as r:
+            r.raise_for_status()
+            for chunk in r.iter_content(CHUNK_SIZE):
+                buf.write(chunk)
+        with zipfile.ZipFile(buf) as z:
+            z.extract(WCA_FILE)
+        if etag is not None:
+            with open(WCA_ETAG_FILE, "w") as f:
+                f.write(etag)
+        print("WCA rankings data downloaded and extracted.")
 
 def load_wca_data():
-    return pd.read_csv(WCA_FILE, sep='\t')
-
-### Step 2: Scrape registrations ###
+    # Reuse the typed Parquet copy unless the TSV has been re-downloaded since
+    if os.path.exists(WCA_PARQUET) and os.path.getmtime(WCA_PARQUET) >= os.path.getmtime(WCA_FILE):
+        df = pd.read_parquet(WCA_PARQUET, columns=WCA_COLUMNS).astype(WCA_DTYPES)
+    else:
+        df = pd.read_csv(WCA_FILE, sep='\t', engine="pyarrow", usecols=WCA_COLUMNS, dtype=WCA_DTYPES)
+        df.to_parquet(WCA_PARQUET, compression="zstd", index=False)
+    return df.set_index("personId")
+
+### Step 2: Fetch registrations ###
 COMPETITION_ID = "MidAtlanticChampionship2025"
 REGISTRATIONS_URL = f"https://www.worldcubeassociation.org/competitions/{COMPETITION_ID}/registrations"
+COMPETITORS_API_URL = f"https://www.worldcubeassociation.org/api/v0/competitions/{COMPETITION_ID}/competitors"
 
 def get_registrations():
+    try:
+        return fetch_registrations()
+    except (requests.RequestException, ValueError, KeyError, TypeError) as e:
+        print(f"Registrations API unavailable ({e}), falling back to Selenium…")
+        return scrape_registrations()
+
+def fetch_registrations():
+    r = requests.get(COMPETITORS_API_URL, timeout=30)
+    r.raise_for_status()
+    data = r.json()
+    if not isinstance(data, list):
+        raise ValueError(f"expected a list of competitors, got {type(data).__name__}")
+    return [{"Name": p["name"], "personId": p.get("wca_id")} for p in data]
+
+# Read every row's first cell in one WebDriver round-trip: [name, profile href or null]
+FIRST_CELLS_JS = """
+return Array.from(arguments[0].querySelectorAll("tr")).slice(1)
+    .map(tr => tr.querySelector("td"))
+    .filter(td => td)
+    .map(td => {
+        const a = td.querySelector("a");
+        return a ? [a.innerText, a.href] : [td.innerText, null];
+    });
+"""
+
+def scrape_registrations():
     options = webdriver.ChromeOptions()
     options.add_argument("--headless")
     driver = webdriver.Chrome(options=options)
@@ -45,87 +104,97 @@ def get_registrations():
         table = WebDriverWait(driver, 10).until(
             EC.presence_of_element_located((By.TAG_NAME, "table"))
         )
+        cells = driver.execute_script(FIRST_CELLS_JS, table)
         results = []
-        for row in table.find_elements(By.TAG_NAME, "tr")[1:]:
-            cells = row.find_elements(By.TAG_NAME, "td")
-            if not cells: continue
-            link = cells[0].find_elements(By.TAG_NAME, "a")
-            if link:
-                name = link[0].text.strip()
-                pid  = link[0].get_attribute("href").split("/")[-1]
-            else:
-                name = cells[0].text.strip()
-                pid  = None
-            results.append({"Name": name, "personId": pid})
+        for name, href in cells:
+            pid = href.split("/")[-1] if href else None
+            results.append({"Name": name.strip(), "personId": pid})
         return results
     finally:
         driver.quit()
 
 ### Step 3: Match & pivot ###
 def process_competitor_data(comps, wca_df):
-    rows = []
-    for c in comps:
-        pid = c["personId"]; name = c["Name"]
-        if not pid: continue
-        pdata = wca_df[wca_df["personId"] == pid]
-        if pdata.empty: continue
-        pivot = pdata.pivot(index="personId", columns="eventId", values=["best","worldRank"])
-        pivot.columns = [f"{ev}_{typ}" for typ,ev in pivot.columns]
-        pivot.reset_index(inplace=True)
-        pivot.insert(0, "Name", name)
-        rows.append(pivot)
-    return pd.concat(rows, ignore_index=True) if rows else pd.DataFrame(columns=["Name","personId"])
+    regs = [c for c in comps if c["personId"]]
+    ids = pd.Index(list(dict.fromkeys(c["personId"] for c in regs)))
+    sub = wca_df[wca_df.index.isin(ids)]
+    if sub.empty:
+        return pd.DataFrame(columns=["Name","personId"])
+    # Scatter each ranking into a (person, event) grid instead of pivoting
+    people = ids.get_indexer(sub.index)
+    codes, event_idx = np.unique(sub["eventId"].cat.codes.to_numpy(), return_inverse=True)
+    events = sub["eventId"].cat.categories[codes]
+    best = np.full((len(ids), len(events)), np.nan)
+    rank = np.full((len(ids), len(events)), np.nan)
+    best[people, event_idx] = sub["best"].to_numpy()
+    rank[people, event_idx] = sub["worldRank"].to_numpy()
+    # Keep registration order and drop registrants with no rankings
+    matched = np.zeros(len(ids), dtype=bool)
+    matched[people] = True
+    rows = ids.get_indexer([c["personId"] for c in regs])
+    keep = matched[rows]
+    rows = rows[keep]
+    data = {"Name": [c["Name"] for c, k in zip(regs, keep) if k], "personId": ids[rows].to_numpy()}
+    data.update({f"{ev}_best": best[rows, j] for j, ev in enumerate(events)})
+    data.update({f"{ev}_worldRank": rank[rows, j] for j, ev in enumerate(events)})
+    return pd.DataFrame(data)
 
 ### Step 4: Format best columns ###
-def format_best_columns(df):
-    bests = [c for c in df if c.endswith("_best")]
-    df[bests] = df[bests].div(100).round(1)
+def format_best_columns(df, best_cols):
+    bests = list(best_cols)
+    arr = df[bests].to_numpy(dtype=np.float64, na_value=np.nan, copy=True)
+    np.divide(arr, 100.0, out=arr)
+    np.round(arr, 1, out=arr)
+    df[bests] = arr
     return df
 
-### Step 5: Sort columns with Name, personId first ###
-def sort_columns_custom(df):
+### Step 5: Build "WR Top 100" strings for each row ###
+def build_wr_top100(df, wr_cols, wr_events):
+    ranks = df[list(wr_cols)].to_numpy(dtype=np.float32, na_value=np.nan)
+    entries = [[] for _ in range(len(df))]
+    for i, j in zip(*np.nonzero(ranks <= 100)):
+        entries[i].append(f"{wr_events[j]} (#{int(ranks[i, j])})")
+    return [", ".join(e) for e in entries]
+
+### Step 6: Assemble output: Name, personId, WR Top 100 first, rows by 333_worldRank ###
+def build_output(df, wr_top100):
     fixed = ["Name","personId"]
     others = sorted(c for c in df if c not in fixed)
-    return df[fixed+others]
-
-### Step 6: Sort rows by 333_worldRank ###
-def sort_rows_by_333(df):
     if "333_worldRank" in df:
-        return df.sort_values("333_worldRank", na_position="last")
-    return df
+        # NaN sorts last; stable keeps registration order among ties
+        order = np.argsort(df["333_worldRank"].to_numpy(dtype=np.float64, na_value=np.nan), kind="stable")
+    else:
+        order = np.arange(len(df))
+    data = {c: df[c].to_numpy()[order] for c in fixed}
+    data["WR Top 100"] = np.asarray(wr_top100, dtype=object)[order]
+    data.update({c: df[c].to_numpy()[order] for c in others})
+    return pd.DataFrame(data)
 
 ### Step 7: Run pipeline & save main CSV ###
 def main():
     t0 = time.time()
-    download_wca_data()
-    wca_df = load_wca_data()
-
-    print("Scraping registrations…")
-    comps = get_registrations()
+    # The export download and the registrations fetch are independent; overlap them
+    print("Fetching registrations…")
+    with ThreadPoolExecutor(max_workers=2) as ex:
+        registrations = ex.submit(get_registrations)
+        ex.submit(download_wca_data).result()
+        wca_df = load_wca_data()
+        comps = registrations.result()
 
     print("Processing rankings…")
     df = process_competitor_data(comps, wca_df)
-    df = format_best_columns(df)
-    df = sort_columns_custom(df)
-    df = sort_rows_by_333(df)
-
-    # Step 8: Build "WR Top 100" strings for each row
-    wr_list = []
-    for _, row in df.iterrows():
-        entries = []
-        for col in df.columns:
-            if col.endswith("_worldRank") and pd.notna(row[col]) and row[col] <= 100:
-                event = col.split("_")[0]
-                rank  = int(row[col])
-                entries.append(f"{event} (#{rank})")
-        wr_list.append(", ".join(entries))
-
-    # Insert as the 3rd column (index=2)
-    df.insert(2, "WR Top 100", wr_list)
+
+    # Derive the per-event column groups once, in final (sorted) column order
+    best_cols = tuple(sorted(c for c in df.columns if c.endswith("_best")))
+    wr_cols = tuple(sorted(c for c in df.columns if c.endswith("_worldRank")))
+    wr_events = tuple(c[:-len("_worldRank")] for c in wr_cols)
+
+    df = format_best_columns(df, best_cols)
+    df = build_output(df, build_wr_top100(df, wr_cols, wr_events))
 
     # Save the combined file
     out_main = f"{COMPETITION_ID}_competitor_rankings.csv"
-    df.to_csv(out_main, index=False)
+    pacsv.write_csv(pa.Table.from_pandas(df, preserve_index=False), out_main)
     print(f"Saved combined rankings to {out_main}")
 
     print(f"Done in {time.time() - t0:.2f}s")